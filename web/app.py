@@ -1,125 +1,266 @@
-from flask import Flask, render_template, request, jsonify, send_file, Response, stream_with_context
+from flask import Flask, render_template, request, jsonify, send_file
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
 import yt_dlp
+from yt_dlp.postprocessor import FFmpegExtractAudioPP
 import os
 import re
 import requests
+from requests.adapters import HTTPAdapter
 from pathlib import Path
 import tempfile
+import shutil
+import glob
 import json
 import threading
 import uuid
 import time
-from urllib.parse import urlparse, parse_qs
-from collections import defaultdict
+import atexit
+import functools
+import bisect
+import contextlib
+import queue
+from concurrent.futures import ThreadPoolExecutor
+from collections import defaultdict, OrderedDict
+from cachetools import TTLCache
+import orjson
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """jsonify ve request.json için orjson kullanan JSON sağlayıcısı"""
+    
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default).decode()
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+    
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(
+            orjson.dumps(obj, default=self.default),
+            mimetype=self.mimetype
+        )
+
 
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
 CORS(app)
 
+
+class DownloadStatusCache(TTLCache):
+    """Süresi dolan veya taşan indirme kayıtlarının dosyalarını da temizleyen TTLCache"""
+    
+    def get(self, key, default=None):
+        # Cache.get 'in' kontrolünden sonra okur; arada süresi dolan kayıt KeyError vermesin
+        try:
+            return self[key]
+        except KeyError:
+            return default
+    
+    def popitem(self):
+        key, value = super().popitem()
+        self._evicted(key, value)
+        return key, value
+    
+    def expire(self, time=None):
+        expired = super().expire(time)
+        for key, value in expired:
+            self._evicted(key, value)
+        return expired
+    
+    @staticmethod
+    def _evicted(download_id, status):
+        download_queue.pop(download_id, None)
+        filepath = status.get('filepath')
+        if filepath:
+            _schedule_delete(filepath, download_id)
+
+
 # İndirme durumları ve kuyruğu
+# Durumlar her güncellemede yeni bir dict ile değiştirilir. TTLCache thread-safe
+# değildir (okuma da iç bağlantı listesini değiştirir), bu yüzden okuma, yazma ve
+# silmelerin hepsi kilit altında yapılır.
+# Dosyası hiç istenmeyen kayıtlar bir saat sonra (veya 10.000 kayıtta) düşer
 download_queue = {}
-download_status = {}
+download_status = DownloadStatusCache(maxsize=10_000, ttl=3600)
 download_lock = threading.Lock()
 
+
+def _set_status(download_id, status):
+    """İndirme durumunu yeni bir dict ile değiştirir"""
+    with download_lock:
+        download_status[download_id] = status
+
+
+def _get_status(download_id, default=None):
+    """İndirme durumunu döndürür"""
+    with download_lock:
+        return download_status.get(download_id, default)
+
+
+# İndirme (ağ) ve ffmpeg işleme (CPU) ayrı sınırlı havuzlarda çalışır,
+# böylece bir iş dönüştürülürken diğeri indirilmeye devam eder
+DL_WORKERS = max(min(os.cpu_count() or 1, int(os.getenv('DL_WORKERS', '4'))), 1)
+NET_POOL = ThreadPoolExecutor(max_workers=DL_WORKERS, thread_name_prefix='download')
+PP_POOL = ThreadPoolExecutor(max_workers=os.cpu_count() or 1, thread_name_prefix='postprocess')
+atexit.register(NET_POOL.shutdown, wait=False)
+atexit.register(PP_POOL.shutdown, wait=False)
+
+# Geçici dosyalar için RAM tabanlı tmpfs. Bir iş tmpfs'e ancak beklenen boyutu,
+# devam eden tmpfs işlerinin ayırdığı alan ve TMPFS_MIN_FREE payı sığıyorsa yazar
+TMPFS_DIR = '/dev/shm'
+TMPFS_MIN_FREE = int(os.getenv('TMPFS_MIN_FREE_GB', '1')) << 30
+_tmpfs_reserved = {}
+_tmpfs_lock = threading.Lock()
+
+# progress_hook güncellemeleri arasındaki minimum süre (saniye)
+PROGRESS_INTERVAL = 0.1
+
+# DASH/HLS parçalarını paralel indirme ayarları
+FRAGMENT_OPTS = {
+    'concurrent_fragment_downloads': int(os.getenv('YTDLP_FRAG_N', '5')),
+    'http_chunk_size': 10 * 1024 * 1024,
+}
+# aria2c kuruluysa çok bağlantılı indirme için kullan
+if shutil.which('aria2c'):
+    FRAGMENT_OPTS['external_downloader'] = 'aria2c'
+    FRAGMENT_OPTS['external_downloader_args'] = {'aria2c': ['-x', '16', '-s', '16', '-k', '1M']}
+
+# URL'lerden video ID çıkarmak için derlenmiş regex:
+# sadece youtube.com / youtube-nocookie.com / youtu.be adreslerinde, tam 11 karakterlik ID
+_YT_ID_RE = re.compile(
+    r'^\s*(?:https?://)?(?:[A-Za-z0-9-]+\.)*'
+    r'(?:youtube\.com/(?:watch/?\?(?:[^#]*?&)?v=|embed/|shorts/|live/)'
+    r'|youtube-nocookie\.com/embed/'
+    r'|youtu\.be/)'
+    r'([A-Za-z0-9_-]{11})(?![A-Za-z0-9_-])'
+)
+
+# Desteklenen kalite basamakları (artan sırada, bisect için)
+QUALITY_LADDER = (144, 240, 360, 480, 720, 1080, 1440, 2160)
+
+# Tekrar kullanılan YoutubeDL örnekleri - opsiyon setine göre havuzlanır.
+# YoutubeDL thread-safe olmadığı için her örnek aynı anda tek işte kullanılır.
+# Opsiyonlar istekten gelen kaliteyi içerebildiği için en son kullanılan
+# YDL_POOL_KEYS set tutulur, eskilerin örnekleri kapatılır
+YDL_POOL_KEYS = 8
+_ydl_pools = OrderedDict()
+_ydl_pools_lock = threading.Lock()
+
+# Video bilgisi önbelleği - aynı URL için yt-dlp'yi tekrar çalıştırmaz
+info_cache = TTLCache(maxsize=512, ttl=600)
+info_cache_lock = threading.Lock()
+
 # YouTube Data API v3 için (opsiyonel - arama için)
 YOUTUBE_API_KEY = os.getenv('YOUTUBE_API_KEY', '')
 
+# Google API'ye keep-alive bağlantılar için paylaşılan HTTP oturumu
+_HTTP = requests.Session()
+_HTTP.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=16))
 
-def clean_youtube_url(url):
-    """YouTube URL'sini temizler - & işaretinden sonrasını ve playlist parametrelerini kaldırır"""
+
+@functools.lru_cache(maxsize=4096)
+def _parse_youtube_url(url):
+    """URL'yi tek regex eşleşmesiyle (temiz URL, video ID) ikilisine ayırır"""
     if not url:
-        return url
-    
-    # URL'yi parse et
-    parsed = urlparse(url)
-    
-    # Video ID'yi al
-    if 'youtube.com/watch' in url or 'youtu.be' in url:
-        # Video ID'yi çıkar
-        video_id = None
-        if 'youtu.be' in url:
-            # youtu.be/VIDEO_ID formatı
-            video_id = parsed.path.lstrip('/').split('?')[0].split('&')[0]
-        elif 'watch' in parsed.path or 'v=' in parsed.query:
-            # youtube.com/watch?v=VIDEO_ID formatı
-            query_params = parse_qs(parsed.query)
-            if 'v' in query_params:
-                video_id = query_params['v'][0].split('&')[0]
-        
-        if video_id:
-            # Temiz URL oluştur
-            return f"https://www.youtube.com/watch?v={video_id}"
-    
-    # Eğer playlist URL'si ise, sadece video ID'yi al
-    if 'list=' in url:
-        # Playlist URL'sinden video ID'yi çıkar
-        match = re.search(r'[?&]v=([^&]+)', url)
-        if match:
-            video_id = match.group(1)
-            return f"https://www.youtube.com/watch?v={video_id}"
+        return url, None
+    
+    # Tek geçişte 11 karakterlik video ID'yi bul (watch, youtu.be, embed, shorts, live, playlist)
+    match = _YT_ID_RE.match(url)
+    if match:
+        video_id = match.group(1)
+        return f"https://www.youtube.com/watch?v={video_id}", video_id
     
     # Diğer durumlar için orijinal URL'yi döndür
-    return url.split('&')[0] if '&' in url else url
+    return (url.split('&')[0] if '&' in url else url), None
+
+
+def clean_youtube_url(url):
+    """YouTube URL'sini temizler - & işaretinden sonrasını ve playlist parametrelerini kaldırır"""
+    return _parse_youtube_url(url)[0]
 
 
 def extract_video_id(url):
     """YouTube URL'den video ID çıkarır"""
-    url = clean_youtube_url(url)
-    patterns = [
-        r'(?:youtube\.com\/watch\?v=|youtu\.be\/|youtube\.com\/embed\/)([^&\n?#]+)',
-        r'youtube\.com\/watch\?.*v=([^&\n?#]+)'
-    ]
-    for pattern in patterns:
-        match = re.search(pattern, url)
-        if match:
-            return match.group(1)
-    return None
+    return _parse_youtube_url(url)[1]
 
 
 def get_video_info(url):
-    """Video bilgilerini alır ve maksimum kaliteyi tespit eder"""
+    """Video bilgilerini alır ve maksimum kaliteyi tespit eder (sonuçlar önbelleklenir)"""
     url = clean_youtube_url(url)
+    with info_cache_lock:
+        if url in info_cache:
+            return info_cache[url]
+    
+    result = _fetch_video_info(url)
+    
+    # Hataları önbelleğe alma, bir sonraki istekte tekrar denensin
+    if 'error' not in result:
+        with info_cache_lock:
+            info_cache[url] = result
+    return result
+
+
+@contextlib.contextmanager
+def _borrow_ydl(opts):
+    """Aynı opsiyonlarla oluşturulmuş bir YoutubeDL örneğini ödünç verir"""
+    key = tuple(sorted(opts.items()))
+    evicted = []
+    with _ydl_pools_lock:
+        pool = _ydl_pools.get(key)
+        if pool is None:
+            pool = _ydl_pools[key] = []
+            while len(_ydl_pools) > YDL_POOL_KEYS:
+                evicted.extend(_ydl_pools.popitem(last=False)[1])
+        else:
+            _ydl_pools.move_to_end(key)
+        ydl = pool.pop() if pool else None
+    
+    for old in evicted:
+        old.close()
+    if ydl is None:
+        ydl = yt_dlp.YoutubeDL(dict(opts))
+    
+    try:
+        yield ydl
+    finally:
+        # Havuz bu arada düşürüldüyse örneği geri koyma, kapat
+        with _ydl_pools_lock:
+            if _ydl_pools.get(key) is pool:
+                pool.append(ydl)
+                ydl = None
+        if ydl is not None:
+            ydl.close()
+
+
+def _fetch_video_info(url):
+    """yt-dlp ile video bilgilerini çeker"""
     ydl_opts = {
         'quiet': True,
         'no_warnings': True,
+        # Playlist ise sadece ilk videoyu çözümle
+        'playlist_items': '1',
     }
     try:
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        with _borrow_ydl(ydl_opts) as ydl:
             info = ydl.extract_info(url, download=False)
             
             # Playlist kontrolü
             if 'entries' in info and info.get('_type') == 'playlist':
                 # Playlist ise ilk videoyu al
-                entries = [e for e in info.get('entries', []) if e]
-                if entries:
-                    info = entries[0]
-                else:
+                info = next((e for e in info.get('entries') or () if e), None)
+                if info is None:
                     return {'error': 'Playlist boş veya erişilemiyor'}
             
             # Mevcut formatları analiz et ve maksimum kaliteyi bul
-            max_height = 0
-            available_qualities = set()
-            
-            if 'formats' in info:
-                for fmt in info['formats']:
-                    height = fmt.get('height')
-                    if height:
-                        available_qualities.add(height)
-                        if height > max_height:
-                            max_height = height
-            
-            # Maksimum kaliteyi belirle
-            max_quality = 'best'
-            quality_order = [2160, 1440, 1080, 720, 480, 360, 240, 144]
-            
-            for q in quality_order:
-                if q <= max_height:
-                    max_quality = f'{q}p'
-                    break
+            available_qualities = {f['height'] for f in info.get('formats') or () if f.get('height')}
+            max_height = max(available_qualities, default=0)
             
+            # Maksimum kaliteyi belirle (max_height'e eşit/altındaki en yüksek basamak)
             # Eğer hiç kalite bulunamazsa varsayılan olarak 'best'
-            if max_height == 0:
-                max_quality = 'best'
+            i = bisect.bisect_right(QUALITY_LADDER, max_height) - 1
+            max_quality = f'{QUALITY_LADDER[i]}p' if i >= 0 else 'best'
             
             return {
                 'title': info.get('title', 'Bilinmeyen'),
@@ -129,24 +270,71 @@ def get_video_info(url):
                 'view_count': info.get('view_count', 0),
                 'max_quality': max_quality,
                 'max_height': max_height,
-                'available_qualities': sorted(list(available_qualities), reverse=True) if available_qualities else []
+                'available_qualities': sorted(available_qualities, reverse=True)
             }
     except Exception as e:
         return {'error': str(e)}
 
 
-def download_video_with_progress(download_id, url, format_type='video', file_format='mp4', quality='best'):
-    """Video veya ses indirir ve progress takibi yapar"""
+def _estimate_size(info):
+    """Seçilen formatların toplam boyutunu döndürür, bilinmiyorsa None"""
+    formats = info.get('requested_formats') or [info]
+    sizes = [f.get('filesize') or f.get('filesize_approx') for f in formats]
+    return sum(sizes) if sizes and all(sizes) else None
+
+
+def _reserve_temp_dir(download_id, expected_size):
+    """İndirme için geçici dizini seçer: yer ayrılabiliyorsa tmpfs, değilse disk"""
+    # Boyutu bilinmeyen işler doğrudan diske yazılır
+    if expected_size:
+        # Ham dosyalar ile birleştirilmiş/dönüştürülmüş çıktı bir süre birlikte durur
+        needed = expected_size * 2
+        with _tmpfs_lock:
+            try:
+                free = shutil.disk_usage(TMPFS_DIR).free if os.path.isdir(TMPFS_DIR) else 0
+            except OSError:
+                free = 0
+            # Devam eden işlerin yazdığı kısım free'den de düşüldüğü için hesap temkinlidir
+            if free - sum(_tmpfs_reserved.values()) - needed >= TMPFS_MIN_FREE:
+                _tmpfs_reserved[download_id] = needed
+                return TMPFS_DIR
+    return tempfile.gettempdir()
+
+
+def _release_temp_dir(download_id):
+    """İş bittiğinde tmpfs ayrımını bırakır (dosya artık free değerine yansır)"""
+    with _tmpfs_lock:
+        _tmpfs_reserved.pop(download_id, None)
+
+
+def _remove_partial_files(temp_dir, download_id):
+    """Hata durumunda işin yarım kalan geçici dosyalarını siler"""
+    for path in glob.glob(os.path.join(temp_dir, f"{download_id}.*")):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def fetch_stage(download_id, url, format_type='video', file_format='mp4', quality='best'):
+    """Ağ aşaması: videoyu/sesi indirir, ses dönüştürmeyi postprocess aşamasına bırakır"""
     url = clean_youtube_url(url)
+    temp_dir = None
     
-    # Geçici dosya oluştur
-    temp_dir = tempfile.gettempdir()
-    temp_file = os.path.join(temp_dir, f"{download_id}.tmp")
+    # Son progress güncellemesinin zamanı (güncellemeleri seyreltmek için)
+    last_update_ts = 0.0
     
     def progress_hook(d):
+        nonlocal last_update_ts
         try:
             status = d.get('status')
             if status == 'downloading':
+                # Saniyede en fazla ~10 güncelleme; arayüz daha hızlı çizemez
+                now = time.monotonic()
+                if now - last_update_ts < PROGRESS_INTERVAL:
+                    return
+                last_update_ts = now
+                
                 total = d.get('total_bytes') or d.get('total_bytes_estimate', 0)
                 downloaded = d.get('downloaded_bytes', 0)
                 if total and total > 0:
@@ -156,6 +344,7 @@ def download_video_with_progress(download_id, url, format_type='video', file_for
                 
                 progress_data = {
                     'status': 'downloading',
+                    'stage': 'downloading',
                     'percent': round(percent, 2),
                     'downloaded': downloaded,
                     'total': total,
@@ -163,48 +352,32 @@ def download_video_with_progress(download_id, url, format_type='video', file_for
                     'eta': d.get('eta', 0)
                 }
                 
-                with download_lock:
-                    download_status[download_id] = progress_data
-                    
-                # Debug: Progress güncellemesi
-                print(f"Progress update for {download_id}: {percent:.2f}%")
+                _set_status(download_id, progress_data)
+                
+                app.logger.debug("Progress update for %s: %.2f%%", download_id, percent)
                 
             elif status == 'finished':
-                with download_lock:
-                    download_status[download_id] = {
-                        'status': 'processing',
-                        'percent': 95
-                    }
-                print(f"Download finished for {download_id}, processing...")
+                _set_status(download_id, {
+                    'status': 'processing',
+                    'stage': 'downloading',
+                    'percent': 95
+                })
+                app.logger.debug("Download finished for %s, processing...", download_id)
         except Exception as e:
             # Progress hook hatası indirmeyi durdurmamalı
-            print(f"Progress hook error for {download_id}: {e}")
+            app.logger.warning("Progress hook error for %s: %s", download_id, e)
     
     try:
         if format_type == 'audio':
-            # Ses formatı ve kalite ayarları
-            audio_codec = file_format.lower()
-            quality_map = {
-                '128': '128',
-                '192': '192',
-                '256': '256',
-                '320': '320',
-                'best': '192'
-            }
-            audio_quality = quality_map.get(quality, '192')
-            
+            # Sadece ham sesi indir, dönüştürme postprocess_stage'de yapılır
             ydl_opts = {
                 'format': 'bestaudio/best',
-                'outtmpl': temp_file.replace('.tmp', '.%(ext)s'),
-                'postprocessors': [{
-                    'key': 'FFmpegExtractAudio',
-                    'preferredcodec': audio_codec,
-                    'preferredquality': audio_quality,
-                }],
+                'postprocessors': [],
                 'progress_hooks': [progress_hook],
                 'noprogress': False,
                 'quiet': True,
                 'no_warnings': True,
+                **FRAGMENT_OPTS,
             }
         else:
             # Video formatı ve kalite ayarları
@@ -228,44 +401,161 @@ def download_video_with_progress(download_id, url, format_type='video', file_for
             
             ydl_opts = {
                 'format': format_string,
-                'outtmpl': temp_file.replace('.tmp', '.%(ext)s'),
                 'merge_output_format': video_format,
                 'progress_hooks': [progress_hook],
                 'noprogress': False,
                 'quiet': True,
                 'no_warnings': True,
+                **FRAGMENT_OPTS,
             }
         
+        # Önce bilgileri çıkar, seçilen formatların boyutuna göre geçici dizini seç
+        with _borrow_ydl({'quiet': True, 'no_warnings': True, 'format': ydl_opts['format']}) as ydl:
+            info = ydl.extract_info(url, download=False)
+        
+        # Geçici dosya oluştur
+        temp_dir = _reserve_temp_dir(download_id, _estimate_size(info))
+        ydl_opts['outtmpl'] = os.path.join(temp_dir, f"{download_id}.%(ext)s")
+        
         with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(url, download=True)
-            filename = ydl.prepare_filename(info)
-            
-            # Format'a göre doğru uzantıyı ekle
-            if format_type == 'audio':
-                if file_format.lower() == 'wav':
-                    filename = filename.rsplit('.', 1)[0] + '.wav'
-                else:
-                    filename = filename.rsplit('.', 1)[0] + '.mp3'
-            else:
-                # Video formatına göre uzantıyı ayarla
-                video_ext = file_format.lower()
-                if not filename.endswith(f'.{video_ext}'):
-                    filename = filename.rsplit('.', 1)[0] + f'.{video_ext}'
+            # Çıkarılmış bilgiyle indir, extractor tekrar çalışmaz
+            info = ydl.process_ie_result(info, download=True)
             
-            with download_lock:
-                download_status[download_id] = {
-                    'status': 'completed',
-                    'percent': 100,
-                    'filename': os.path.basename(filename),
-                    'filepath': filename,
-                    'title': info.get('title', 'Bilinmeyen')
-                }
+            # Diskteki gerçek dosya yolunu yt-dlp'den al: tek dosyalı (birleştirilmeyen)
+            # formatlar merge_output_format'a uymaz, kaynak uzantısını korur.
+            # Ses için bu bilgi postprocessor'a da verilir
+            downloads = info.get('requested_downloads') or [info]
+            raw_info = downloads[0]
+            if not raw_info.get('filepath'):
+                raw_info['filepath'] = ydl.prepare_filename(info)
+            filename = raw_info['filepath']
+        
+        return {
+            'download_id': download_id,
+            'format_type': format_type,
+            'file_format': file_format,
+            'quality': quality,
+            'filepath': filename,
+            'info': raw_info,
+            'title': info.get('title', 'Bilinmeyen')
+        }
     except Exception as e:
-        with download_lock:
-            download_status[download_id] = {
-                'status': 'error',
-                'error': str(e)
+        if temp_dir:
+            _remove_partial_files(temp_dir, download_id)
+        _release_temp_dir(download_id)
+        _set_status(download_id, {
+            'status': 'error',
+            'error': str(e)
+        })
+        return None
+
+
+def postprocess_stage(job):
+    """İşleme aşaması: gerekiyorsa ffmpeg ile ses dönüştürür ve indirmeyi tamamlar"""
+    download_id = job['download_id']
+    filename = job['filepath']
+    
+    try:
+        if job['format_type'] == 'audio':
+            _set_status(download_id, {
+                'status': 'processing',
+                'stage': 'postprocessing',
+                'percent': 95
+            })
+            
+            # Ses formatı ve kalite ayarları
+            audio_codec = job['file_format'].lower()
+            quality_map = {
+                '128': '128',
+                '192': '192',
+                '256': '256',
+                '320': '320',
+                'best': '192'
             }
+            audio_quality = quality_map.get(job['quality'], '192')
+            
+            with _borrow_ydl({'quiet': True, 'no_warnings': True}) as ydl:
+                pp = FFmpegExtractAudioPP(
+                    ydl,
+                    preferredcodec=audio_codec,
+                    preferredquality=audio_quality,
+                )
+                info = ydl.run_pp(pp, job['info'])
+                filename = info.get('filepath') or filename
+        
+        _set_status(download_id, {
+            'status': 'completed',
+            'percent': 100,
+            'filename': os.path.basename(filename),
+            'filepath': filename,
+            'title': job['title']
+        })
+    except Exception as e:
+        _remove_partial_files(os.path.dirname(job['filepath']), download_id)
+        _set_status(download_id, {
+            'status': 'error',
+            'error': str(e)
+        })
+    finally:
+        _release_temp_dir(download_id)
+
+
+def submit_download(download_id, url, format_type='video', file_format='mp4', quality='best'):
+    """İndirmeyi ağ havuzuna gönderir, bitince işleme havuzuna zincirler"""
+    def on_fetched(future):
+        # Future sadece queued/running ayrımı için tutulur; iş bitince bırak ki
+        # sonucu (yt-dlp info dict'i) indirme kaydıyla birlikte bellekte kalmasın
+        download_queue.pop(download_id, None)
+        job = future.result()
+        if job is not None:
+            PP_POOL.submit(postprocess_stage, job)
+    
+    future = NET_POOL.submit(fetch_stage, download_id, url, format_type, file_format, quality)
+    # Callback'ten önce kaydet: iş çoktan bittiyse callback hemen çalışıp kaydı siler
+    download_queue[download_id] = future
+    future.add_done_callback(on_fetched)
+    return future
+
+
+def _delete_worker():
+    """Silme kuyruğunu tüketen tek arka plan thread'i"""
+    while True:
+        filepath, download_id = _DELETE_Q.get()
+        try:
+            if os.path.exists(filepath):
+                os.remove(filepath)
+            with download_lock:
+                download_status.pop(download_id, None)
+                download_queue.pop(download_id, None)
+        except Exception as e:
+            app.logger.warning("Error deleting file %s: %s", filepath, e)
+
+
+def _schedule_delete(filepath, download_id):
+    """Gönderilen dosyayı ve indirme kaydını silme kuyruğuna ekler"""
+    _DELETE_Q.put((filepath, download_id))
+
+
+def _delete_on_close(response, filepath, download_id):
+    """Yanıt gövdesi kapatıldığında (gönderim bitince) dosyayı silme kuyruğuna ekler"""
+    # direct_passthrough yanıtlarda call_on_close çalışmaz; sunucu gövdenin
+    # close() metodunu çağırır. Sarmalayıcının tipini korumak için (sendfile)
+    # sadece close() metodunu değiştiriyoruz
+    body = response.response
+    close = getattr(body, 'close', None)
+    
+    def close_and_delete():
+        try:
+            if close is not None:
+                close()
+        finally:
+            _schedule_delete(filepath, download_id)
+    
+    body.close = close_and_delete
+
+
+_DELETE_Q = queue.SimpleQueue()
+threading.Thread(target=_delete_worker, name='janitor', daemon=True).start()
 
 
 def search_youtube(query, max_results=10):
@@ -279,7 +569,7 @@ def search_youtube(query, max_results=10):
                 'extract_flat': True,
             }
             search_url = f'ytsearch{max_results}:{query}'
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+            with _borrow_ydl(ydl_opts) as ydl:
                 results = []
                 info = ydl.extract_info(search_url, download=False)
                 if 'entries' in info:
@@ -306,7 +596,7 @@ def search_youtube(query, max_results=10):
                 'maxResults': max_results,
                 'key': YOUTUBE_API_KEY
             }
-            response = requests.get(search_url, params=params)
+            response = _HTTP.get(search_url, params=params, timeout=5)
             data = response.json()
             
             results = []
@@ -359,19 +649,13 @@ def download():
     download_id = str(uuid.uuid4())
     
     # İndirmeyi kuyruğa ekle
-    with download_lock:
-        download_status[download_id] = {
-            'status': 'queued',
-            'percent': 0
-        }
+    _set_status(download_id, {
+        'status': 'queued',
+        'percent': 0
+    })
     
-    # Arka planda indirmeyi başlat
-    thread = threading.Thread(
-        target=download_video_with_progress,
-        args=(download_id, url, format_type, file_format, quality),
-        daemon=True
-    )
-    thread.start()
+    # İndirmeyi worker havuzuna gönder
+    submit_download(download_id, url, format_type, file_format, quality)
     
     return jsonify({
         'success': True,
@@ -382,63 +666,44 @@ def download():
 @app.route('/api/download/status/<download_id>')
 def download_status_endpoint(download_id):
     """İndirme durumunu döndürür"""
-    with download_lock:
-        status = download_status.get(download_id, {'status': 'not_found'})
-        return jsonify(status)
+    status = _get_status(download_id, {'status': 'not_found'})
+    future = download_queue.get(download_id)
+    
+    # Worker işe başladıysa ama henüz progress gelmediyse 'downloading' bildir
+    if status.get('status') == 'queued' and future is not None and future.running():
+        status = {'status': 'downloading', 'percent': 0}
+    
+    return jsonify(status)
 
 
 @app.route('/api/download/file/<download_id>')
 def download_file(download_id):
-    """İndirilen dosyayı stream eder ve tarayıcıya gönderir"""
-    with download_lock:
-        status = download_status.get(download_id)
-        if not status or status.get('status') != 'completed':
-            return jsonify({'error': 'İndirme tamamlanmadı'}), 404
-        
-        filepath = status.get('filepath')
-        filename = status.get('filename')
+    """İndirilen dosyayı tarayıcıya gönderir (Range destekli)"""
+    status = _get_status(download_id)
+    if not status or status.get('status') != 'completed':
+        return jsonify({'error': 'İndirme tamamlanmadı'}), 404
+    
+    filepath = status.get('filepath')
+    filename = status.get('filename')
     
     if not filepath or not os.path.exists(filepath):
         return jsonify({'error': 'Dosya bulunamadı'}), 404
     
-    def generate():
-        file_handle = None
-        try:
-            file_handle = open(filepath, 'rb')
-            while True:
-                chunk = file_handle.read(8192)
-                if not chunk:
-                    break
-                yield chunk
-        finally:
-            if file_handle:
-                file_handle.close()
-            
-            # Dosyayı stream tamamlandıktan sonra sil (kısa bir gecikme ile)
-            def delete_file_after_delay():
-                import time
-                time.sleep(2)  # İndirme tamamlanması için bekle
-                try:
-                    if os.path.exists(filepath):
-                        os.remove(filepath)
-                    with download_lock:
-                        if download_id in download_status:
-                            del download_status[download_id]
-                except Exception as e:
-                    print(f"Error deleting file: {e}")
-            
-            # Arka planda sil
-            threading.Thread(target=delete_file_after_delay, daemon=True).start()
-    
-    response = Response(
-        stream_with_context(generate()),
-        mimetype='application/octet-stream',
-        headers={
-            'Content-Disposition': f'attachment; filename="{filename}"',
-            'Content-Type': 'application/octet-stream',
-            'Content-Length': str(os.path.getsize(filepath))
-        }
+    # send_file Range isteklerini (206) destekler ve dosyayı wsgi.file_wrapper ile
+    # direct_passthrough olarak döndürür; gunicorn'un gthread worker'ı tam (200)
+    # yanıtları socket.sendfile ile gönderir
+    response = send_file(
+        filepath,
+        as_attachment=True,
+        download_name=filename,
+        conditional=True,
+        mimetype='application/octet-stream'
     )
+    
+    # Dosyayı sadece tamamı gönderildiyse sil; kısmi (Range) isteklerde istemci
+    # devam edebilsin diye, HEAD isteklerinde de asıl GET gelecek diye dosya kalır
+    if response.status_code == 200 and request.method != 'HEAD':
+        _delete_on_close(response, filepath, download_id)
     return response
 
 
@@ -461,4 +726,10 @@ def search():
 
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000, debug=True)
+    # Geliştirme sunucusu; production için: gunicorn -c gunicorn.conf.py app:app
+    app.run(
+        host='0.0.0.0',
+        port=5000,
+        debug=os.getenv('FLASK_DEBUG', '0') == '1',
+        threaded=True
+    )
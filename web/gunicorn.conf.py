@@ -0,0 +1,22 @@
+# Gunicorn ayarları: gunicorn -c gunicorn.conf.py app:app
+import os
+
+bind = os.getenv('BIND', '0.0.0.0:5000')
+
+# gthread worker: her istek gerçek bir OS thread'inde çalışır, böylece uzun
+# dosya gönderimleri status polling isteklerini bekletmez. gevent kullanılmaz;
+# monkey.patch_all() indirme havuzlarını tek thread'deki greenlet'lere çevirip
+# CPU yoğun yt-dlp işlerinin tüm istekleri durdurmasına yol açar
+worker_class = 'gthread'
+threads = int(os.getenv('THREADS', '16'))
+
+# İndirme durumları süreç belleğinde tutulur, bu yüzden tek worker kullanılır
+workers = 1
+
+# Uzun dosya gönderimleri için
+timeout = 0
+
+# send_file yanıtları wsgi.file_wrapper ile döner; gthread worker bunları
+# varsayılan olarak socket.sendfile (os.sendfile) ile gönderir. 'sendfile'
+# ayarı verilmemeli: gunicorn bu ayara herhangi bir değer verilince
+# (True dahil) sendfile'ı kapatır